@@ -1,70 +1,89 @@
 import requests
 import pandas as pd
+import numpy as np
 import re
 import os
 import sys
-from datetime import date, datetime
-from io import StringIO
+from datetime import date
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+except ImportError:
+    pa = None
 
 # --- Configuration (TEMPLATE) ---
 ETF_TICKER = "KYLD" # <-- CHANGE THIS FOR OTHER ETFs
 DOWNLOAD_URL = f"https://web.services.kurvinvest.com/etfdata/{ETF_TICKER}/holdings.csv"
 OUTPUT_FILENAME = f"enriched_{ETF_TICKER}.csv"
 ARCHIVE_FILENAME_BASE = "holdings.csv"
+NUMBA_MIN_ROWS = 100_000 # Decode strikes with Numba above this many rows (if installed)
 # --- End Configuration ---
 
-def parse_option_ticker(ticker):
+# Descriptions matching any of these are cash, treasury, or other non-security lines
+CASH_KEYWORDS = ['TREASURY', 'CASH', 'SWAP', 'REPURCHASE', 'RECEIVABLE', 'DEPOSIT', 'FUTURES', 'CONTRACT', 'MMKT']
+CASH_RE = re.compile('|'.join(CASH_KEYWORDS), re.IGNORECASE)
+
+# Option ticker pattern: [ROOT][YYMMDD][C/P][STRIKE_PRICE], e.g. 'BWXT251219C00195000'
+# -> Date: 251219, Type: C, Strike: 00195000 (strike is in thousandths)
+OPT_RE = re.compile(r'(\d{6})([CP])(\d+)$')
+
+# Widest strike the Numba decoder handles; 19+ digits would overflow its int64 accumulator
+NUMBA_MAX_DIGITS = 18
+_strike_decoder = None
+
+def _decode_strike_buffer(buf, out):
     """
-    Parses a complex option ticker string (cleaned of spaces) to extract its components.
-    
-    Assumes pattern: [ROOT][YYMMDD][C/P][STRIKE_PRICE]
-    Example: 'BWXT251219C00195000' -> Date: 251219, Type: C, Strike: 00195000
-    
-    Returns a tuple: (Expiration_Date_Formatted, Option_Type, Strike_Price_Decimal)
+    Parses each zero-padded row of ASCII digits in buf into out[i] / 1000.
+    Empty rows (non-option holdings) become NaN.
     """
-    # Regex pattern: (\d{6}) captures 6-digit date; ([CP]) captures C or P; (\d+) captures strike
-    match = re.search(r'(\d{6})([CP])(\d+)', str(ticker))
-    
-    if match:
-        yy_mm_dd = match.group(1)
-        option_type = match.group(2)
-        strike_raw = match.group(3)
-        
-        # 1. Format Expiration Date (YYMMDD to YYYY-MM-DD)
-        try:
-            date_obj = datetime.strptime(yy_mm_dd, '%y%m%d')
-            expiration_date = date_obj.strftime('%Y-%m-%d')
-        except ValueError:
-            expiration_date = None
-        
-        # 2. Convert Strike Price (dividing by 1000)
-        try:
-            strike_price = int(strike_raw) / 1000.0
-        except ValueError:
-            strike_price = None
+    for i in range(buf.shape[0]):
+        if buf[i, 0] == 0:
+            out[i] = np.nan
+            continue
+        value = 0
+        for j in range(buf.shape[1]):
+            if buf[i, j] == 0:
+                break
+            value = value * 10 + (buf[i, j] - 48)
+        out[i] = value / 1000.0
 
-        return expiration_date, option_type, strike_price
-    
-    return None, None, None
+def _get_strike_decoder():
+    """
+    Imports Numba and JIT-compiles _decode_strike_buffer on first use, so small
+    files never pay the import cost. Returns None if numba isn't installed.
+    """
+    global _strike_decoder
+    if _strike_decoder is None:
+        try:
+            from numba import njit
+        except ImportError:
+            return None
+        _strike_decoder = njit(cache=True)(_decode_strike_buffer)
+    return _strike_decoder
 
-def classify_holding(row):
+def decode_strikes(strike_raw):
     """
-    Classifies the holding based on Option Type and Quantity.
+    Converts raw strike digit strings (NaN for non-options) to strike prices (dividing by 1000).
+    
+    For very large holdings files the digits are packed into one fixed-width byte
+    buffer and decoded by a Numba-compiled loop; otherwise pandas' to_numeric is used.
+    Strikes wider than NUMBA_MAX_DIGITS always go through to_numeric.
     """
-    quantity = row['Quantity']
-    option_type = row['Put/Call']
+    decoder = _get_strike_decoder() if len(strike_raw) > NUMBA_MIN_ROWS else None
+    if decoder is None:
+        return pd.to_numeric(strike_raw, errors='coerce') / 1000.0
     
-    if pd.notna(option_type) and quantity < 0:
-        if option_type == 'C':
-            return 'CC' # Covered Call (Short Call)
-        elif option_type == 'P':
-            return 'CSP' # Cash-Secured Put (Short Put)
+    wide = strike_raw.str.len().gt(NUMBA_MAX_DIGITS).fillna(False).to_numpy(dtype=bool)
+    fixed = strike_raw.where(~wide).fillna('').to_numpy(dtype='S')
+    buf = fixed.view(np.uint8).reshape(len(fixed), fixed.itemsize)
+    out = np.empty(len(fixed), dtype=np.float64)
+    decoder(buf, out)
     
-    # Non-option holdings are classified as 'Stock'
-    if pd.isna(option_type):
-        return 'Stock' 
-    else:
-        return f'Long {option_type}' # Long Call or Long Put
+    strikes = pd.Series(out, index=strike_raw.index)
+    if wide.any():
+        strikes[wide] = pd.to_numeric(strike_raw[wide], errors='coerce') / 1000.0
+    return strikes
 
 def process_etf_data():
     """
@@ -73,22 +92,28 @@ def process_etf_data():
     try:
         # --- DOWNLOAD AND ARCHIVE ---
         print(f"Attempting to download file for {ETF_TICKER} from: {DOWNLOAD_URL}")
-        response = requests.get(DOWNLOAD_URL, stream=True)
-        response.raise_for_status() # Check for bad status codes
-        print("Download successful.")
-        
-        # Read content for pandas
-        file_content_text = response.content.decode('utf-8')
-
-        # 1. Save the dated archive copy
         today = date.today().strftime("%Y-%m-%d")
         dated_filename = f"{today}_{ETF_TICKER}_{ARCHIVE_FILENAME_BASE}"
-        with open(dated_filename, 'w', encoding='utf-8') as f:
-            f.write(file_content_text)
+        
+        # 1. Stream the download straight into the dated archive copy (1 MB chunks, never fully in memory)
+        with requests.get(DOWNLOAD_URL, stream=True) as response:
+            response.raise_for_status() # Check for bad status codes
+            with open(dated_filename, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+        print("Download successful.")
         print(f"Saved dated archive copy as: {dated_filename}")
 
-        # 2. Load data directly from memory into Pandas
-        df = pd.read_csv(StringIO(file_content_text))
+        # 2. Load the archive copy into Pandas (multi-threaded pyarrow parser when available)
+        df = None
+        if pa is not None:
+            try:
+                df = pacsv.read_csv(dated_filename).to_pandas()
+            except pa.ArrowInvalid:
+                # pyarrow rejects ragged rows (e.g. a trailing disclaimer line); pandas tolerates them
+                df = None
+        if df is None:
+            df = pd.read_csv(dated_filename, encoding='utf-8')
         
         if 'Ticker' not in df.columns or 'Quantity' not in df.columns or 'Description' not in df.columns:
              print("Error: The CSV must contain 'Ticker', 'Quantity', and 'Description' columns.")
@@ -103,20 +128,37 @@ def process_etf_data():
         df['Ticker'] = df['Ticker'].astype(str).str.replace(' ', '')
         
         # 4. Filter out cash, treasury, and other non-security lines
-        cash_keywords = ['TREASURY', 'CASH', 'SWAP', 'REPURCHASE', 'RECEIVABLE', 'DEPOSIT', 'FUTURES', 'CONTRACT', 'MMKT']
-        mask = ~df['Description'].astype(str).str.upper().str.contains('|'.join(cash_keywords), na=False)
+        mask = ~df['Description'].astype(str).str.contains(CASH_RE, na=False)
         df = df[mask].reset_index(drop=True)
         print(f"Filtered to {len(df)} security lines.")
 
-        # 5. Apply the parsing function and expand results
-        parsed_results = df['Ticker'].apply(parse_option_ticker)
-        df[['Expiration', 'Put/Call', 'Strike']] = pd.DataFrame(parsed_results.tolist(), index=df.index)
+        # 5. Parse option tickers in one vectorized pass
+        parts = df['Ticker'].str.extract(OPT_RE, expand=True)
+        # Holdings share a handful of expiries, so cache=True parses each unique date once
+        expirations = pd.to_datetime(parts[0], format='%y%m%d', cache=True, errors='coerce')
+        df['Expiration'] = expirations.dt.strftime('%Y-%m-%d')
+        df['Put/Call'] = parts[1]
+        df['Strike'] = decode_strikes(parts[2])
         
-        # 6. Apply the classification logic
-        df['Classification'] = df.apply(classify_holding, axis=1)
+        # 6. Classify holdings based on Option Type and Quantity
+        put_call = df['Put/Call']
+        quantity = df['Quantity']
+        conditions = [
+            put_call.isna(),                    # Non-option holdings
+            (put_call == 'C') & (quantity < 0), # Covered Call (Short Call)
+            (put_call == 'P') & (quantity < 0), # Cash-Secured Put (Short Put)
+            put_call == 'C',                    # Long Call
+            put_call == 'P',                    # Long Put
+        ]
+        choices = ['Stock', 'CC', 'CSP', 'Long C', 'Long P']
+        df['Classification'] = np.select(conditions, choices, default='Stock')
         
         # 7. Add ETF column
         df['ETF'] = ETF_TICKER
+        
+        # Low-cardinality labels are stored as categoricals (CSV output is unchanged)
+        for col in ('ETF', 'Put/Call', 'Classification'):
+            df[col] = df[col].astype('category')
 
         # 8. Final Column Reordering
         target_start_cols = ['ETF', 'Ticker', 'Put/Call', 'Strike', 'Expiration', 'Classification']
@@ -134,8 +176,8 @@ def process_etf_data():
         sys.exit(1)
     except ImportError:
         print("\n--- REQUIRED LIBRARY MISSING ---")
-        print("The 'pandas' and 'requests' libraries are required.")
-        print("Please install them using: \n\n    pip install requests pandas")
+        print("The 'pandas', 'numpy' and 'requests' libraries are required.")
+        print("Please install them using: \n\n    pip install requests pandas numpy")
         print("----------------------------------")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
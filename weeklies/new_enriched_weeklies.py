@@ -1,9 +1,18 @@
 import requests
-import csv
 import os
+import pickle
+import shutil
 import yfinance as yf
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
 from datetime import datetime
 import pandas as pd
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
 
 # ================= CONFIGURATION =================
 CSV_URL = "https://www.cboe.com/available_weeklys/get_csv_download/"
@@ -14,6 +23,13 @@ OUTPUT_DIR = "data"
 # Set to True to calculate real IV from option chains (Slower, ~1 sec per stock)
 # Set to False to use Beta/Fast checks only
 FETCH_REAL_IV = True 
+
+# Set to True to fetch P/S and Fwd P/E from the full .info scrape (Slower)
+# Set to False to take price, volume and SMAs from the batched history only (P/S and Fwd P/E are skipped)
+FETCH_VALUATION = True
+
+# Number of tickers fetched from yfinance in parallel (network-bound, not CPU-bound)
+MAX_WORKERS = 32
 # =================================================
 
 def ensure_output_dir():
@@ -26,14 +42,15 @@ def download_weeklys():
     headers = {'User-Agent': 'Mozilla/5.0'}
     print(f"Downloading CBOE Data...")
     try:
-        response = requests.get(CSV_URL, headers=headers)
-        response.raise_for_status()
-        
         today_str = datetime.now().strftime("%Y-%m-%d")
         filepath = os.path.join(OUTPUT_DIR, f"raw_weeklys_{today_str}.csv")
         
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
+        # Stream straight to disk in 1 MB chunks instead of buffering the whole body
+        with requests.get(CSV_URL, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            with open(filepath, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
             
         return filepath
     except Exception as e:
@@ -43,30 +60,67 @@ def download_weeklys():
 def parse_csv_to_data(filepath):
     data_map = {}
     try:
-        with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if len(row) < 2: continue
-                col0, col1 = row[0].strip().upper(), row[1].strip()
-                
-                # Basic filters to skip headers and dates
-                if not col0 or "AVAILABLE WEEKLYS" in col0 or "TICKER" in col0: continue
-                # Skip rows where the name looks like a date (e.g. 11/28/25)
-                if "/" in col1 and len(col1) <= 10 and any(c.isdigit() for c in col1): continue
-                
-                data_map[col0] = col1
+        # Rows vary in width, so only the first two columns are read; short rows and blank names come back as NaN
+        df = pd.read_csv(filepath, header=None, names=['Ticker', 'Name'], usecols=[0, 1], dtype=str,
+                         keep_default_na=False, na_values=[''], encoding_errors='replace').dropna()
+        tickers = df['Ticker'].str.strip().str.upper()
+        names = df['Name'].str.strip()
+        
+        # Basic filters to skip headers and dates
+        mask = tickers.ne('') & ~tickers.str.contains('AVAILABLE WEEKLYS|TICKER', regex=True)
+        # Skip rows where the name looks like a date (e.g. 11/28/25)
+        mask &= ~(names.str.contains('/', regex=False) & names.str.len().le(10) & names.str.contains(r'\d', regex=True))
+        
+        data_map = dict(zip(tickers[mask], names[mask]))
     except Exception as e:
         print(f"Error parsing CSV: {e}")
         
     return data_map
 
-def get_wheel_metrics(ticker_symbol):
+def get_history_stats(tickers):
+    """
+    Downloads 1y of price history for all tickers in one batched request and
+    returns {ticker: {"Price", "Volume", "SMA50", "SMA200"}}. An SMA is left out
+    when the ticker has fewer closes than its window.
+    """
+    stats_map = {}
+    try:
+        prices = yf.download(list(tickers), period="1y", group_by="ticker", threads=True, auto_adjust=True, progress=False)
+    except Exception as e:
+        print(f"Error downloading price history: {e}")
+        return stats_map
+    
+    for ticker in tickers:
+        try:
+            hist = prices[ticker].dropna(subset=['Close'])
+        except KeyError:
+            continue
+        if hist.empty:
+            continue
+        
+        closes = hist['Close']
+        stats = {
+            "Price": round(closes.iloc[-1], 2),
+            "Volume": hist['Volume'].iloc[-63:].mean(), # ~3 months of sessions, like averageVolume
+        }
+        # Simple Moving Averages over the last 50 / 200 closes
+        if len(closes) >= 50:
+            stats["SMA50"] = closes.iloc[-50:].mean()
+        if len(closes) >= 200:
+            stats["SMA200"] = closes.iloc[-200:].mean()
+        stats_map[ticker] = stats
+            
+    return stats_map
+
+def get_wheel_metrics(ticker_symbol, history_stats=None):
     """
     Fetches metrics specifically for the Wheel Strategy, including 50 & 200 SMAs.
+    history_stats is this ticker's entry from the batched history download (see get_history_stats).
     """
+    history_stats = history_stats or {}
     metrics = {
         "Price": 0, "IV": "N/A", "Volume": 0, 
-        "SMA50": 0, "SMA200": 0, "Trend": "SIDEWAYS", 
+        "SMA50": 0, "SMA200": 0, 
         "PriceToSales": 0, "ForwardPE": 0, "Earnings": "N/A"
     }
     
@@ -74,35 +128,23 @@ def get_wheel_metrics(ticker_symbol):
         tick = yf.Ticker(ticker_symbol)
         
         # 1. Basic Info & Valuation
-        info = tick.info
-        price = info.get('currentPrice', 0)
+        if FETCH_VALUATION:
+            # The .info scrape is needed for P/S and Fwd P/E and already carries price, volume and SMA200
+            info = tick.info
+            price = info.get('currentPrice', 0)
+            metrics["Volume"] = info.get('averageVolume', 0)
+            metrics["SMA200"] = info.get('twoHundredDayAverage', 0)
+            metrics["PriceToSales"] = info.get('priceToSalesTrailing12Months', 0)
+            metrics["ForwardPE"] = info.get('forwardPE', 0)
+        else:
+            # No per-ticker request at all: everything comes from the batched history download
+            price = history_stats.get("Price", 0)
+            metrics["Volume"] = history_stats.get("Volume", 0)
+            metrics["SMA200"] = history_stats.get("SMA200", 0)
         metrics["Price"] = price
-        metrics["Volume"] = info.get('averageVolume', 0)
-        metrics["PriceToSales"] = info.get('priceToSalesTrailing12Months', 0)
-        metrics["ForwardPE"] = info.get('forwardPE', 0)
-        
-        # 2. Trend (Price vs 50 & 200 SMAs)
-        # Fetching history to calculate 50-day SMA, as yfinance info only provides 200-day
-        hist = tick.history(period="1y")
         
-        sma200 = info.get('twoHundredDayAverage', 0)
-        metrics["SMA200"] = sma200
-        
-        sma50 = 0
-        if not hist.empty and len(hist) >= 50:
-            # Calculate 50-day Simple Moving Average (SMA)
-            sma50 = hist['Close'].iloc[-50:].mean() # A simple approx. for 50-day SMA
-            metrics["SMA50"] = round(sma50, 2)
-            
-        # Determine Trend based on stacking (Price > 50 > 200 or Price < 50 < 200)
-        # Check that all values are non-zero before comparison
-        if price > 0 and sma50 > 0 and sma200 > 0:
-            if price > sma50 and sma50 > sma200:
-                metrics["Trend"] = "UP" # Bullish: Price > SMA50 > SMA200
-            elif price < sma50 and sma50 < sma200:
-                metrics["Trend"] = "DOWN" # Bearish: Price < SMA50 < SMA200
-            else:
-                metrics["Trend"] = "SIDEWAYS"
+        # 2. 50-day SMA (Trend is classified for all tickers at once in build_rows)
+        metrics["SMA50"] = history_stats.get("SMA50", 0)
         
         # 3. Earnings Date
         try:
@@ -137,35 +179,45 @@ def get_wheel_metrics(ticker_symbol):
         
     return metrics
 
-def save_local_files(data_map, date_str):
-    # We save two files: 
-    # 1. Dated file (for history)
-    # 2. "Latest" file (for easy opening)
-    archive_filename = f"weeklys_enriched_{date_str}.csv"
-    latest_filename = "weeklys_latest.csv"
-    
-    archive_path = os.path.join(OUTPUT_DIR, archive_filename)
-    latest_path = os.path.join(OUTPUT_DIR, latest_filename)
-    
+def build_rows(data_map):
+    """
+    Fetches Wheel metrics for every ticker and returns the rows for the output CSV.
+    """
     print(f"\nAnalyzing {len(data_map)} tickers for Wheel metrics...")
     
     rows = []
-    total = len(data_map)
-    count = 0
+    tickers, names = zip(*sorted(data_map.items()))
     
-    # Process tickers
-    for ticker, name in sorted(data_map.items()):
-        count += 1
-        print(f"Processing {count}/{total}: {ticker}...", end='\r')
-        
-        m = get_wheel_metrics(ticker)
-        
+    # One batched history download instead of a tick.history() call per ticker
+    stats_map = get_history_stats(tickers)
+    
+    # Process tickers in parallel; each call uses its own yf.Ticker so threads share no state
+    # Progress is updated from the main thread as each ticker completes
+    results = [None] * len(tickers)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex, tqdm(total=len(tickers), desc="Processing") as pbar:
+        futures = {ex.submit(get_wheel_metrics, ticker, stats_map.get(ticker)): i for i, ticker in enumerate(tickers)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            pbar.update(1)
+    
+    # Determine Trend based on stacking (Price > 50 > 200 or Price < 50 < 200)
+    # Only when all values are non-zero; otherwise SIDEWAYS
+    price = np.array([m["Price"] for m in results], dtype=float)
+    sma50 = np.array([m["SMA50"] for m in results], dtype=float)
+    sma200 = np.array([m["SMA200"] for m in results], dtype=float)
+    valid = (price > 0) & (sma50 > 0) & (sma200 > 0)
+    trends = np.select(
+        [valid & (price > sma50) & (sma50 > sma200),  # Bullish: Price > SMA50 > SMA200
+         valid & (price < sma50) & (sma50 < sma200)], # Bearish: Price < SMA50 < SMA200
+        ["UP", "DOWN"], default="SIDEWAYS")
+    
+    for ticker, name, m, trend in zip(tickers, names, results, trends):
         rows.append({
             "Ticker": ticker,
             "Name": name,
             "Price": m["Price"],
             "IV %": m["IV"],
-            "Trend": m["Trend"],      # UP/DOWN/SIDEWAYS based on stacking
+            "Trend": trend,           # UP/DOWN/SIDEWAYS based on stacking
             "SMA 50": round(m["SMA50"], 2) if m["SMA50"] else "N/A",
             "SMA 200": round(m["SMA200"], 2) if m["SMA200"] else "N/A",
             "P/S": round(m["PriceToSales"], 2) if m["PriceToSales"] else "N/A",
@@ -174,18 +226,78 @@ def save_local_files(data_map, date_str):
             "Earnings": m["Earnings"]
         })
 
-    # Write to disk
-    for filepath in [latest_path, archive_path]:
+    return rows
+
+def save_local_files(data_map, date_str):
+    # We save two files: 
+    # 1. Dated file (for history)
+    # 2. "Latest" file (for easy opening)
+    archive_filename = f"weeklys_enriched_{date_str}.csv"
+    latest_filename = "weeklys_latest.csv"
+    
+    archive_path = os.path.join(OUTPUT_DIR, archive_filename)
+    latest_path = os.path.join(OUTPUT_DIR, latest_filename)
+    
+    # Reuse the metrics from an earlier run for the same date, ticker list and fetch settings instead of refetching
+    cache_path = os.path.join(OUTPUT_DIR, f"cache_{date_str}.pkl")
+    cache_key = {"data_map": data_map, "FETCH_REAL_IV": FETCH_REAL_IV, "FETCH_VALUATION": FETCH_VALUATION}
+    rows = None
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            cached = None # Unreadable or truncated cache: treat as a miss and refetch
+        if isinstance(cached, dict) and cached.get("key") == cache_key:
+            print(f"\nLoading cached metrics from: {cache_path}")
+            rows = cached["rows"]
+    
+    if rows is None:
+        rows = build_rows(data_map)
+        # Only cache a run that actually fetched data, so a rate-limited run isn't frozen for the day
+        priced = sum(1 for row in rows if row["Price"] > 0)
+        if priced >= len(rows) / 2:
+            # Dump to a temp file and swap it in, so an interrupted run never leaves a truncated cache
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({"key": cache_key, "rows": rows}, f)
+            os.replace(tmp_path, cache_path)
+        else:
+            print(f"\nOnly {priced}/{len(rows)} tickers returned a price; not caching this run.")
+
+    # Write to disk: one pandas serialize pass, then hard-link the "latest" file to it
+    # Updated fieldnames to include new SMA columns
+    fieldnames = ["Ticker", "Name", "Price", "IV %", "Trend", "SMA 50", "SMA 200", "P/S", "Fwd P/E", "Avg Vol (M)", "Earnings"]
+    # object dtype keeps each value as-is (e.g. 0 stays 0, not 0.0) next to the "N/A" placeholders
+    out = pd.DataFrame(rows, columns=fieldnames, dtype=object)
+    try:
+        out.to_csv(archive_path, index=False)
+        print(f"\nSaved: {archive_path}")
+        if os.path.exists(latest_path):
+            os.remove(latest_path)
         try:
-            with open(filepath, 'w', newline='', encoding='utf-8') as f:
-                # Updated fieldnames to include new SMA columns
-                fieldnames = ["Ticker", "Name", "Price", "IV %", "Trend", "SMA 50", "SMA 200", "P/S", "Fwd P/E", "Avg Vol (M)", "Earnings"]
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(rows)
-            print(f"\nSaved: {filepath}")
-        except Exception as e:
-            print(f"Error saving {filepath}: {e}")
+            os.link(archive_path, latest_path)
+        except OSError:
+            # Filesystem without hard link support: fall back to a plain copy
+            shutil.copyfile(archive_path, latest_path)
+        print(f"Saved: {latest_path}")
+    except Exception as e:
+        print(f"Error saving {archive_path}: {e}")
+
+    # Parquet sidecar for fast downstream loading (skipped when pyarrow isn't installed)
+    if pa is None:
+        print("Skipped Parquet sidecar (pyarrow not installed).")
+        return
+    
+    # Parquet needs one type per column, so the "N/A" placeholders become nulls here
+    parquet_path = archive_path.replace('.csv', '.parquet')
+    numeric_cols = ["Price", "IV %", "SMA 50", "SMA 200", "P/S", "Fwd P/E", "Avg Vol (M)"]
+    try:
+        sidecar = out.assign(**{col: pd.to_numeric(out[col], errors='coerce') for col in numeric_cols})
+        sidecar.to_parquet(parquet_path, compression='zstd', index=False)
+        print(f"Saved: {parquet_path}")
+    except Exception as e:
+        print(f"Error saving {parquet_path}: {e}")
 
 if __name__ == "__main__":
     ensure_output_dir()